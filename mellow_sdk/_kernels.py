@@ -0,0 +1,56 @@
+"""
+    numba kernels for backtest hot loops
+"""
+
+import numpy as np
+from numba import njit
+
+
+# all fast-math flags except nnan / ninf: rows without price_before come as NaN and must stay out of range
+FASTMATH = {"nsz", "arcp", "contract", "afn", "reassoc"}
+
+
+@njit(cache=True, fastmath=FASTMATH)
+def accumulate_fees(
+    amount0: np.ndarray,
+    amount1: np.ndarray,
+    liquidity: np.ndarray,
+    price_before: np.ndarray,
+    lower_price: float,
+    upper_price: float,
+    fee_percent: float,
+    position_liquidity: float,
+):
+    """
+    | Accumulate fees of a UniswapV3 position with fixed liquidity over swap events.
+    | Same math as ``UniV3Position.charge_fees_share`` applied to every row.
+
+    Args:
+        amount0: Swap amounts of X, negative when X is paid to the pool.
+        amount1: Swap amounts of Y, negative when Y is paid to the pool.
+        liquidity: Pool tick liquidity after each swap.
+        price_before: Prices before each swap.
+        lower_price: Lower bound of the position interval.
+        upper_price: Upper bound of the position interval.
+        fee_percent: Pool fee expressed as a fraction.
+        position_liquidity: Liquidity of the position.
+
+    Returns:
+        Cumulative X fees, cumulative Y fees after each event.
+    """
+    n = amount0.shape[0]
+    fees_x = np.empty(n)
+    fees_y = np.empty(n)
+
+    acc_x = 0.0
+    acc_y = 0.0
+    for i in range(n):
+        if lower_price <= price_before[i] and price_before[i] <= upper_price:
+            share = position_liquidity / (liquidity[i] + position_liquidity)
+            if amount0[i] < 0:
+                acc_x += -amount0[i] * fee_percent * share
+            if amount1[i] < 0:
+                acc_y += -amount1[i] * fee_percent * share
+        fees_x[i] = acc_x
+        fees_y[i] = acc_y
+    return fees_x, fees_y
@@ -1,14 +1,80 @@
+from collections.abc import Mapping
 import copy
-from typing import Tuple
+import os
+import tempfile
+from typing import List, Optional, Tuple
+import numpy as np
 import polars as pl
+from joblib import Parallel, delayed
 from tqdm import tqdm
 
 
-from mellow_sdk.strategies import AbstractStrategy
+from mellow_sdk._kernels import accumulate_fees
+from mellow_sdk.strategies import AbstractStrategy, Hold, UniV3Passive
 from mellow_sdk.portfolio import Portfolio
 from mellow_sdk.history import PortfolioHistory, RebalanceHistory, UniPositionsHistory
 
 
+class RecordView(Mapping):
+    """
+    | ``RecordView`` is a read-only view of one row of the backtest data.
+    | Data is kept column-wise, so no dict is built per row, while strategies still access
+    | values by name, e.g. ``record["price"]``.
+    | It is a ``Mapping``, so it supports iteration, ``len``, ``items`` and ``values`` like a dict,
+    | and ``copy`` returns the row as a dict.
+
+    Attributes:
+        columns: Dict of column name to column values.
+        i: Row number.
+    """
+
+    __slots__ = ("columns", "i")
+
+    def __init__(self, columns: dict, i: int) -> None:
+        self.columns = columns
+        self.i = i
+
+    def __getitem__(self, key: str):
+        return self.columns[key][self.i]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.columns
+
+    def get(self, key: str, default=None):
+        """
+        Get value by column name.
+
+        Args:
+            key: Column name.
+            default: Value returned when there is no such column.
+
+        Returns:
+            Value of the column in this row.
+        """
+        column = self.columns.get(key)
+        if column is None:
+            return default
+        return column[self.i]
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __len__(self) -> int:
+        return len(self.columns)
+
+    def keys(self):
+        return self.columns.keys()
+
+    def copy(self) -> dict:
+        """
+        Get the row as a dict.
+
+        Returns:
+            Dict of column name to value.
+        """
+        return {key: column[self.i] for key, column in self.columns.items()}
+
+
 class Backtest:
     """
     | ``Backtest`` emulate portfolio behavior on historical data.
@@ -41,10 +107,18 @@ class Backtest:
         | 'init', 'rebalance', 'stop', 'some_cool_action', None. When there is no strategy action ``rebalance`` returns None.
         | 3) Add Strategy action to ``RebalanceHistory``
         | 4) Add Porfolio snapshot to ``PortfolioHistory``
-        | 5) Add Porfolio snapshot to ``UniPositionsHistory``
+        | 5) Add Porfolio snapshot to ``UniPositionsHistory`` for the first row and the rows where ``rebalance``
+        | returned an action, other rows repeat the positions of the last snapshot. So a strategy that opens,
+        | closes or changes UniV3 positions must return an action name (not None) from ``rebalance``.
         |
         | You can call ``AbstractStrategy.rebalance`` with any arguments, as it takes *args, **kwargs.
         | Note that 'timestamp', 'price' and 'portfolio' is required.
+        | ``record`` is passed as a ``RecordView`` of the current row, a read-only ``Mapping`` rather than a dict,
+        | use ``record.copy()`` to get a dict. It has only the columns in ``AbstractStrategy.required_columns``
+        | (plus timestamp, price and block_number) when the strategy sets them.
+        | Besides the df columns it has ``timestamp_ns``, the timestamp as int nanoseconds since epoch.
+        | Rows that do not match ``AbstractStrategy.relevant_events`` are not passed to the strategy,
+        | histories keep the last snapshot for them.
 
         Attributes:
             df: df with pool events, or df with market data. df format is [('timestamp': datetime, 'price' : float)]
@@ -69,24 +143,246 @@ class Backtest:
 
         # if every_block:
 
-        for record in df.to_dicts():  # record gets single swap event one by one.
+        # subclasses may override rebalance, so only the exact strategy types are vectorized
+        if (
+            type(self.strategy) in (UniV3Passive, Hold)
+            and not self.portfolio.positions
+            and df.shape[0] > 0
+        ):
+            return self._vectorized_backtest(df)
+
+        if df.shape[0] == 0:
+            return portfolio_history, rebalance_history, uni_history
+
+        timeline = self._timeline(df)
+        rows = np.arange(df.shape[0])
+
+        events_filter = self.strategy.relevant_events()
+        if events_filter is not None:
+            df = df.with_row_count("row_nr").filter(events_filter)
+            rows = df["row_nr"].cast(pl.Int64).to_numpy()
+            df = df.drop("row_nr")
+
+            if len(rows) == 0 or rows[0] > 0:
+                # portfolio state for the rows before the first relevant event
+                timestamp, price, block_number = timeline.row(0)
+                portfolio_history.add_snapshot(
+                    self.portfolio.snapshot(timestamp, price, block_number)
+                )
+                portfolio_history.set_timeline(timeline, np.concatenate([[0], rows]))
+            else:
+                portfolio_history.set_timeline(timeline, rows)
+
+        # positions only change on rebalances, so they are snapshotted at the first row
+        # and after every rebalance, and then repeated for the rows in between
+        uni_history.add_snapshot(timeline["timestamp"][0], self.portfolio.positions)
+        uni_rows = [0]
+
+        portfolio_history.preallocate(df.shape[0] + 1, ["price"])
+        columns = self._to_columns(df, self.strategy.required_columns)
+        for i in range(df.shape[0]):  # record gets single swap event one by one.
+            record = RecordView(columns, i)
             is_rebalanced = self.strategy.rebalance(
                 record=record, portfolio=self.portfolio
             )
             portfolio_snapshot = self.portfolio.snapshot(
                 timestamp=record["timestamp"],
                 price=record["price"],
-                block_number=record.get("price", None),
+                block_number=record.get("block_number", None),
             )
             portfolio_history.add_snapshot(portfolio_snapshot)
             rebalance_history.add_snapshot(record["timestamp"], is_rebalanced)
-            uni_history.add_snapshot(
-                record["timestamp"], copy.copy(self.portfolio.positions)
+            if is_rebalanced is not None:
+                uni_history.add_snapshot(record["timestamp"], self.portfolio.positions)
+                uni_rows.append(rows[i])
+
+        uni_history.set_timeline(timeline["timestamp"], np.array(uni_rows, dtype=np.int64))
+        return portfolio_history, rebalance_history, uni_history
+
+    @staticmethod
+    def run_sweep(
+        strategies: List[AbstractStrategy],
+        df: pl.DataFrame,
+        portfolio: Portfolio = None,
+        n_jobs: int = -1,
+        **kwargs,
+    ) -> List[Tuple[PortfolioHistory, RebalanceHistory, UniPositionsHistory]]:
+        """
+        | Run independent backtests of several strategies on the same data in parallel processes,
+        | e.g. to sweep strategy parameters.
+        | ``df`` is written once to an Arrow IPC file that every process memory maps,
+        | so it is not serialized for every strategy.
+
+        Attributes:
+            strategies: Strategies to backtest.
+            df: df with pool events, or df with market data.
+            portfolio: Initial portfolio, every strategy starts with its own copy.
+            n_jobs: Number of processes, -1 means all cores.
+            kwargs: Arguments of ``Backtest.backtest``, e.g. by_block.
+        Returns:
+            | History classes of every strategy, in the same order as ``strategies``.
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "df.arrow")
+            df.write_ipc(path)
+
+            return Parallel(n_jobs=n_jobs, backend="loky")(
+                delayed(_run_backtest)(strategy, path, portfolio, kwargs)
+                for strategy in strategies
             )
 
+    @staticmethod
+    def _timeline(df: pl.DataFrame) -> pl.DataFrame:
+        """
+        Get timestamp, price and block number of every row.
+
+        Attributes:
+            df: df with pool events, or df with market data.
+        Returns:
+            Data frame with timestamp, price and block_number columns.
+        """
+        if "block_number" in df.columns:
+            block_numbers = df["block_number"]
+        else:
+            block_numbers = pl.Series("block_number", [None] * df.shape[0], dtype=pl.Int64)
+        return pl.DataFrame([df["timestamp"], df["price"], block_numbers])
+
+    @staticmethod
+    def _to_columns(df: pl.DataFrame, names: Optional[List[str]] = None) -> dict:
+        """
+        | Convert data frame to dict of columns for row by row access.
+        | Columns are kept as lists of python values: indexing them is cheaper than
+        | boxing numpy scalars, and datetimes and nulls keep their python types.
+
+        Attributes:
+            df: df with pool events, or df with market data.
+            names: Columns to convert besides timestamp, price and block_number, None means all columns.
+        Returns:
+            | Dict of column name to column values.
+            | ``timestamp_ns`` column with timestamps as int nanoseconds since epoch is added
+            | if it is among ``names`` or ``names`` is None.
+        """
+        with_timestamp_ns = "timestamp" in df.columns and (names is None or "timestamp_ns" in names)
+        if names is None:
+            names = df.columns
+        else:
+            names = set(names) | {"timestamp", "price", "block_number"}
+            names = [name for name in df.columns if name in names]
+
+        columns = {name: df[name].to_list() for name in names}
+        if with_timestamp_ns:
+            columns["timestamp_ns"] = df["timestamp"].dt.epoch("ns").to_list()
+        return columns
+
+    def _vectorized_backtest(
+        self, df: pl.DataFrame
+    ) -> Tuple[PortfolioHistory, RebalanceHistory, UniPositionsHistory]:
+        """
+        | Fast path of ``Backtest.backtest`` for strategies without branching logic.
+        | ``UniV3Passive`` mints once, after that only fees change, so they are accumulated in one ``accumulate_fees`` call.
+        | ``Hold`` changes the portfolio only once a day, so ``rebalance`` is called for the first event of each day
+        | and the snapshots are forward filled in between.
+
+        Attributes:
+            df: df with pool events, or df with market data.
+        Returns:
+            Same history classes as ``Backtest.backtest``.
+        """
+        portfolio_history = PortfolioHistory()
+        rebalance_history = RebalanceHistory()
+        uni_history = UniPositionsHistory()
+
+        timeline = self._timeline(df)
+        timestamps = timeline["timestamp"]
+        prices = timeline["price"]
+
+        if isinstance(self.strategy, UniV3Passive):
+            first_record = df.head(1).to_dicts()[0]
+            self.strategy.create_uni_position(
+                portfolio=self.portfolio, price=first_record["price"]
+            )
+            rebalance_history.add_snapshot(first_record["timestamp"], "mint")
+
+            uni_pos = self.portfolio.get_position("UniV3Passive")
+            fees_x, fees_y = accumulate_fees(
+                *(
+                    df[name].cast(pl.Float64).to_numpy()
+                    for name in ["amount0", "amount1", "liquidity", "price_before"]
+                ),
+                uni_pos.lower_price,
+                uni_pos.upper_price,
+                uni_pos.fee_percent,
+                uni_pos.liquidity,
+            )
+
+            columns = {}
+            for name, pos in self.portfolio.positions.items():
+                if name != uni_pos.name:
+                    columns.update(
+                        pos.snapshot(first_record["timestamp"], first_record["price"], None)
+                    )
+            columns = {
+                key: np.full(df.shape[0], value) for key, value in columns.items()
+            }
+            columns.update(
+                uni_pos.snapshot_columns(prices.to_numpy(), fees_x, fees_y)
+            )
+            snapshots = pl.concat(
+                [
+                    timeline,
+                    pl.DataFrame([pl.Series(key, value) for key, value in columns.items()]),
+                ],
+                how="horizontal",
+            )
+
+            uni_pos.fees_x += fees_x[-1]
+            uni_pos._fees_x_earned_ += fees_x[-1]
+            uni_pos.fees_y += fees_y[-1]
+            uni_pos._fees_y_earned_ += fees_y[-1]
+
+            # position does not change after the mint, so one snapshot is repeated over the timeline
+            uni_history.add_snapshot(first_record["timestamp"], self.portfolio.positions)
+            uni_history.set_timeline(timestamps, np.array([0], dtype=np.int64))
+        else:
+            dates = timestamps.cast(pl.Date)
+            day_starts = np.flatnonzero((dates != dates.shift(1)).fill_null(True).to_numpy())
+
+            day_snapshots = []
+            columns = self._to_columns(df[day_starts], self.strategy.required_columns)
+            for i in range(len(day_starts)):
+                record = RecordView(columns, i)
+                is_rebalanced = self.strategy.rebalance(
+                    record=record, portfolio=self.portfolio
+                )
+                rebalance_history.add_snapshot(record["timestamp"], is_rebalanced)
+                day_snapshots.append(
+                    self.portfolio.snapshot(record["timestamp"], record["price"], None)
+                )
+
+            # forward fill state of each day over all events of the day
+            day_idx = np.searchsorted(day_starts, np.arange(df.shape[0]), side="right") - 1
+            day_df = pl.DataFrame(day_snapshots).drop(
+                ["timestamp", "price", "block_number"]
+            )
+            snapshots = pl.concat(
+                [timeline, day_df[day_idx]],
+                how="horizontal",
+            )
+
+        portfolio_history.add_snapshots(snapshots)
         return portfolio_history, rebalance_history, uni_history
 
 
+def _run_backtest(
+    strategy: AbstractStrategy, path: str, portfolio: Portfolio, kwargs: dict
+) -> Tuple[PortfolioHistory, RebalanceHistory, UniPositionsHistory]:
+    """
+    Backtest one strategy of ``Backtest.run_sweep`` on the df memory mapped from ``path``.
+    """
+    df = pl.read_ipc(path, memory_map=True)
+    return Backtest(strategy, copy.deepcopy(portfolio)).backtest(df, **kwargs)
+
+
 class BacktestTimeCV:
     """
     | ``Backtest`` emulate portfolio behavior on historical data.
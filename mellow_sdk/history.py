@@ -1,3 +1,4 @@
+import operator
 import pandas as pd
 import polars as pl
 import datetime
@@ -5,15 +6,86 @@ import typing as tp
 import numpy as np
 
 
+def _no_value(values: tuple) -> None:
+    return None
+
+
 class PortfolioHistory:
     """
     | ``PortfolioHistory`` accumulate snapshots and can calculate stats over time from snapshots.
     | Each time ``add_snapshot`` method is called it remembers current state in time.
     | All tracked values then can be accessed via ``to_df`` method that will return a ``pl.Dataframe``.
+    | Snapshot values except timestamp and block number are stored as float64, missing ones as NaN.
     """
 
     def __init__(self):
-        self.snapshots = []
+        self.fields = {}
+        self.values = np.empty((0, 0))
+        self.timestamps = []
+        self.block_numbers = []
+        self.snapshots_num = 0
+        self.frames = []
+
+        self.timeline = None
+        self.timeline_rows = None
+
+        # snapshot keys in order of appearance (dict as an ordered set), columns of to_df follow it
+        self.columns = {}
+        self.layouts = []
+        self.layout_nums = []
+
+        self._layout = None
+        self._layout_num = None
+        self._layout_nums = {}
+        self._layout_getters = None
+        self._layout_columns = None
+
+    @property
+    def snapshots(self) -> tp.List[dict]:
+        """
+        | Portfolio snapshots as dicts of portfolio params, one per row of ``to_df``.
+        | Snapshots are rebuilt from the history on every access, so it is slow for long backtests.
+
+        Returns:
+            List of snapshots.
+        """
+        snapshots = []
+        for i in range(self.snapshots_num):
+            snapshot = {}
+            for name in self.layouts[self.layout_nums[i]]:
+                if name == "timestamp":
+                    snapshot[name] = self.timestamps[i]
+                elif name == "block_number":
+                    snapshot[name] = self.block_numbers[i]
+                else:
+                    snapshot[name] = float(self.values[i, self.fields[name]])
+            snapshots.append(snapshot)
+        for frame in self.frames:
+            snapshots.extend(frame.to_dicts())
+
+        if self.timeline is not None:
+            snapshot_num = np.searchsorted(
+                self.timeline_rows, np.arange(self.timeline.shape[0]), side="right"
+            ) - 1
+            snapshots = [
+                {**(snapshots[j] if j >= 0 else {}), **row}
+                for j, row in zip(snapshot_num, self.timeline.to_dicts())
+            ]
+
+        return sorted(snapshots, key=lambda snapshot: snapshot["timestamp"])
+
+    def preallocate(self, n_rows: int, field_names: tp.Sequence[str] = ()) -> None:
+        """
+        | Reserve memory for ``n_rows`` snapshots, so ``add_snapshot`` writes them in place.
+        | Fields that are not known in advance are added when they first appear in a snapshot.
+
+        Args:
+            n_rows: Expected number of snapshots.
+            field_names: Known numeric snapshot fields, e.g. price.
+        """
+        for name in field_names:
+            self._add_field(name)
+        self._grow(n_rows - self.values.shape[0])
 
     def add_snapshot(self, snapshot: dict) -> None:
         """
@@ -22,8 +94,110 @@ class PortfolioHistory:
         Args:
             snapshot: Dict of portfolio params.
         """
-        if snapshot:
-            self.snapshots.append(snapshot)
+        if not snapshot:
+            return
+
+        layout = tuple(snapshot)
+        if layout != self._layout:
+            self._set_layout(layout)
+
+        i = self.snapshots_num
+        if i == self.values.shape[0]:
+            self._grow(max(i, 1024))
+
+        values = tuple(snapshot.values())
+        get_timestamp, get_block_number, get_values = self._layout_getters
+        self.timestamps[i] = get_timestamp(values)
+        self.block_numbers[i] = get_block_number(values)
+        self.layout_nums[i] = self._layout_num
+        if get_values is not None:
+            self.values[i, self._layout_columns] = get_values(values)
+        self.snapshots_num += 1
+
+    def _add_field(self, name: str) -> None:
+        """
+        | Add a column for a new numeric field, earlier snapshots get NaN in it.
+        | Column capacity grows geometrically, as positions keep adding fields during the backtest.
+        """
+        if name not in self.fields:
+            n_columns = self.values.shape[1]
+            if len(self.fields) == n_columns:
+                columns = np.full((self.values.shape[0], max(n_columns, 16)), np.nan)
+                self.values = np.hstack([self.values, columns])
+            self.fields[name] = len(self.fields)
+
+    def _grow(self, n_rows: int) -> None:
+        """
+        Extend the buffers by ``n_rows`` rows.
+        """
+        if n_rows <= 0:
+            return
+        rows = np.full((n_rows, self.values.shape[1]), np.nan)
+        self.values = np.vstack([self.values, rows])
+        self.timestamps.extend([None] * n_rows)
+        self.block_numbers.extend([None] * n_rows)
+        self.layout_nums.extend([None] * n_rows)
+
+    def _set_layout(self, layout: tuple) -> None:
+        """
+        | Prepare getters for a snapshot layout (ordered keys of the snapshot dict).
+        | Layout only changes when positions are opened or closed, so it is reused for most snapshots.
+        """
+        if layout in self._layout_nums:
+            self._layout_num = self._layout_nums[layout]
+        else:
+            self._layout_num = len(self.layouts)
+            self._layout_nums[layout] = self._layout_num
+            self.layouts.append(layout)
+            self.columns.update(dict.fromkeys(layout))
+
+        value_idx = []
+        columns = []
+        for j, name in enumerate(layout):
+            if name not in ("timestamp", "block_number"):
+                self._add_field(name)
+                value_idx.append(j)
+                columns.append(self.fields[name])
+
+        def getter(name):
+            if name in layout:
+                return operator.itemgetter(layout.index(name))
+            return _no_value
+
+        get_values = None
+        if value_idx:
+            get_values = operator.itemgetter(*value_idx)
+
+        if columns and columns == list(range(columns[0], columns[0] + len(columns))):
+            self._layout_columns = slice(columns[0], columns[0] + len(columns))
+        else:
+            self._layout_columns = np.array(columns, dtype=np.int64)
+
+        self._layout = layout
+        self._layout_getters = (getter("timestamp"), getter("block_number"), get_values)
+
+    def add_snapshots(self, snapshots: pl.DataFrame) -> None:
+        """
+        Add a block of portfolio snapshots to history at once.
+
+        Args:
+            snapshots: Data frame of portfolio params, one row per snapshot.
+        """
+        if snapshots.shape[0] > 0:
+            self.frames.append(snapshots)
+
+    def set_timeline(self, timeline: pl.DataFrame, rows: np.ndarray) -> None:
+        """
+        | Set the full timeline of the backtest when snapshots were taken only on some of its rows.
+        | ``to_df`` then returns a snapshot for every row of the timeline: the last snapshot taken at or before
+        | this row, with the row's own timestamp, price and block number.
+
+        Args:
+            timeline: Data frame with timestamp, price and block_number of every row.
+            rows: Row numbers in timeline of the snapshots, in the order they were added.
+        """
+        self.timeline = timeline
+        self.timeline_rows = rows
 
     def to_df(self) -> pl.DataFrame:
         """
@@ -32,8 +206,37 @@ class PortfolioHistory:
         Returns:
             Portfolio history data frame.
         """
-        df = pd.DataFrame(self.snapshots)
-        df2 = pl.from_pandas(df).sort(by=["timestamp"])
+        frames = list(self.frames)
+        if self.snapshots_num > 0:
+            n = self.snapshots_num
+            columns = []
+            for name in {**self.columns, **dict.fromkeys(self.fields)}:
+                if name == "timestamp":
+                    columns.append(pl.Series(name, self.timestamps[:n]))
+                elif name == "block_number":
+                    columns.append(pl.Series(name, self.block_numbers[:n]))
+                else:
+                    columns.append(pl.Series(name, self.values[:n, self.fields[name]], nan_to_null=True))
+            frames.insert(0, pl.DataFrame(columns))
+        df = pl.concat(frames, how="diagonal")
+
+        if self.timeline is not None:
+            snapshot_num = np.searchsorted(
+                self.timeline_rows, np.arange(self.timeline.shape[0]), side="right"
+            ) - 1
+            values = (
+                df.drop(self.timeline.columns)
+                .with_row_count("snapshot_num")
+                .with_column(pl.col("snapshot_num").cast(pl.Int64))
+            )
+            filled = (
+                pl.DataFrame([pl.Series("snapshot_num", snapshot_num, dtype=pl.Int64)])
+                .join(values, on="snapshot_num", how="left")
+                .drop("snapshot_num")
+            )
+            df = pl.concat([self.timeline, filled], how="horizontal")
+
+        df2 = df.sort(by=["timestamp"])
         return df2
 
     def calculate_values(self, df: pl.DataFrame) -> pl.DataFrame:
@@ -353,10 +556,20 @@ class UniPositionsHistory:
     ``UniPositionsHistory`` tracks UniswapV3 positions over time.
     Each time ``add_snapshot`` method is called it remembers all UniswapV3 positions at current time.
     All tracked values then can be accessed via ``to_df`` method that will return a ``pl.Dataframe``.
+
+    Attributes:
+        positions: Records of the UniswapV3 positions of every snapshot. ``Backtest`` takes snapshots only
+            on the first row and on rebalances, so these are not repeated for every row.
+            Use ``to_df`` to get positions expanded over the timeline set by ``set_timeline``.
+        snapshot_starts: Index in ``positions`` of the first record of every snapshot.
     """
 
     def __init__(self):
         self.positions = []
+        self.snapshot_starts = []
+
+        self.timeline = None
+        self.timeline_rows = None
 
     def add_snapshot(self, timestamp: datetime.datetime, positions: dict) -> None:
         """
@@ -366,6 +579,7 @@ class UniPositionsHistory:
             timestamp: Timestamp of snapshot.
             positions: List of Uniswap positions.
         """
+        self.snapshot_starts.append(len(self.positions))
         for name, position in positions.items():
             if "Uni" in name:
                 record = {
@@ -377,6 +591,18 @@ class UniPositionsHistory:
                 }
                 self.positions.append(record)
 
+    def set_timeline(self, timestamps: pl.Series, rows: np.ndarray) -> None:
+        """
+        | Set the full timeline of the backtest when snapshots were taken only on some of its rows.
+        | ``to_df`` then repeats positions of the last snapshot taken at or before every timeline row.
+
+        Args:
+            timestamps: Timestamps of every row.
+            rows: Row numbers in timeline of the snapshots, in the order they were added.
+        """
+        self.timeline = timestamps
+        self.timeline_rows = rows
+
     def to_df(self) -> pl.DataFrame:
         """
         Transform list of Uniswap positions snapshots to data frame.
@@ -384,6 +610,39 @@ class UniPositionsHistory:
         Returns:
             Uniswap positions history data frame.
         """
+        if self.timeline is not None and len(self.positions) > 0:
+            snapshot_num = np.searchsorted(
+                self.timeline_rows, np.arange(len(self.timeline)), side="right"
+            ) - 1
+            position_num = np.arange(len(self.positions))
+            records = (
+                pl.from_records(self.positions)
+                .drop("timestamp")
+                .with_columns(
+                    [
+                        pl.Series(
+                            "snapshot_num",
+                            np.searchsorted(self.snapshot_starts, position_num, side="right") - 1,
+                            dtype=pl.Int64,
+                        ),
+                        pl.Series("position_num", position_num, dtype=pl.Int64),
+                    ]
+                )
+            )
+            intervals_df = (
+                pl.DataFrame(
+                    [
+                        pl.Series("row", np.arange(len(self.timeline)), dtype=pl.Int64),
+                        pl.Series("snapshot_num", snapshot_num, dtype=pl.Int64),
+                        self.timeline.alias("timestamp"),
+                    ]
+                )
+                .join(records, on="snapshot_num", how="inner")
+                .sort(by=["row", "position_num"])
+                .select(["name", "timestamp", "lower_bound", "upper_bound", "liq"])
+            )
+            return intervals_df
+
         if len(self.positions) == 0:
             intervals_df = pl.DataFrame(
                 {
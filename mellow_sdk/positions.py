@@ -1,10 +1,13 @@
 from typing import Tuple, Optional
 from abc import ABC, abstractmethod
 from datetime import datetime
+import logging
 import numpy as np
 
 from mellow_sdk.uniswap_utils import UniswapLiquidityAligner
 
+logger = logging.getLogger(__name__)
+
 
 class AbstractPosition(ABC):
     """
@@ -555,6 +558,34 @@ class BiCurrencyPosition(AbstractPosition):
         self.total_gas_costs += self.gas_cost
         return dx
 
+    def mint_optimal(
+        self, uni_pos: "UniV3Position", x: float, y: float, price: float
+    ) -> Tuple[float, float]:
+        """
+        | Swap x and y of the vault to the optimal proportion for ``uni_pos`` and mint them to it.
+
+        Args:
+            uni_pos: UniswapV3 position to mint to.
+            x: Value of X currency to be minted.
+            y: Value of Y currency to be minted.
+            price: Current price of X in Y currency.
+
+        Returns:
+            X amount minted, Y amount minted.
+        """
+        dx, dy, x_uni, y_uni = uni_pos.aligner.get_swap_and_amounts_to_optimal(
+            x, y, swap_fee=self.swap_fee, price=price
+        )
+
+        if dx > 0:
+            self.swap_x_to_y(dx, price=price)
+        if dy > 0:
+            self.swap_y_to_x(dy, price=price)
+
+        self.withdraw(x_uni, y_uni)
+        uni_pos.deposit(x_uni, y_uni, price=price)
+        return x_uni, y_uni
+
     def snapshot(
         self, timestamp: datetime, price: float, block_number: Optional[int]
     ) -> dict:
@@ -695,7 +726,8 @@ class UniV3Position(AbstractPosition):
         self.y_hold += y
         self.total_gas_costs += self.gas_cost
 
-        print("mint", x, y, d_liq, price)
+        if __debug__:
+            logger.debug("mint %s %s %s %s", x, y, d_liq, price)
 
     def burn(self, liq: float, price: float) -> Tuple[float, float]:
         """
@@ -732,7 +764,8 @@ class UniV3Position(AbstractPosition):
 
         self.total_gas_costs += self.gas_cost
 
-        print("burn", x_out, y_out)
+        if __debug__:
+            logger.debug("burn %s %s", x_out, y_out)
 
         return x_out, y_out
 
@@ -779,7 +812,8 @@ class UniV3Position(AbstractPosition):
         }
 
         """
-        print("tick", tick)
+        if __debug__:
+            logger.debug("tick %s", tick)
         fee_x, fee_y = 0, 0
         # 1. calc generated fee from the swap
         if amount0 < 0:
@@ -790,9 +824,6 @@ class UniV3Position(AbstractPosition):
             fee_y = abs(amount1) * self.fee_percent
 
         # 2. calc my tick liquidity
-        lower_tick = round((np.log([self.lower_price]) / np.log(1.001))[0])
-        upper_tick = round((np.log([self.upper_price]) / np.log(1.001))[0])
-
         Ltick = self.liquidity  # / (upper_tick - lower_tick + 1)
 
         # 3. calc my revenue by tick share if within the range
@@ -805,7 +836,11 @@ class UniV3Position(AbstractPosition):
             self.fees_y += fee_y
             self._fees_y_earned_ += fee_y
 
-            print("charge fee:", self.fees_x, self.fees_y, "swap amount:", amount0, amount1, "liquidity:", self.liquidity, liquidity)
+            if __debug__:
+                logger.debug(
+                    "charge fee: %s %s swap amount: %s %s liquidity: %s %s",
+                    self.fees_x, self.fees_y, amount0, amount1, self.liquidity, liquidity,
+                )
 
     def collect_fees(self) -> Tuple[float, float]:
         """
@@ -818,7 +853,8 @@ class UniV3Position(AbstractPosition):
         fees_y = self.fees_y
         self.fees_x = 0
         self.fees_y = 0
-        print("collect_fees", fees_x, fees_y)
+        if __debug__:
+            logger.debug("collect_fees %s %s", fees_x, fees_y)
         return fees_x, fees_y
 
     # def reinvest_fees(self, price) -> None:
@@ -932,6 +968,38 @@ class UniV3Position(AbstractPosition):
 
         return x, y
 
+    def snapshot_columns(
+        self, price: np.ndarray, fees_x: np.ndarray, fees_y: np.ndarray
+    ) -> dict:
+        """
+        | Vectorized version of ``UniV3Position.snapshot`` for a position with fixed liquidity.
+        | Used by ``Backtest`` to build the whole history of a passive position at once.
+
+        Args:
+            price: Array of prices of X in Y currency.
+            fees_x: Array of accumulated X fees at each price.
+            fees_y: Array of accumulated Y fees at each price.
+
+        Returns: Position snapshot columns.
+        """
+        sqrt_price = np.clip(np.sqrt(price), self.sqrt_lower, self.sqrt_upper)
+        x = self.liquidity * (self.sqrt_upper - sqrt_price) / (self.sqrt_upper * sqrt_price)
+        y = self.liquidity * (sqrt_price - self.sqrt_lower)
+
+        il_to_x = self.x_hold + self.y_hold / price - (x + y / price)
+        il_to_y = self.x_hold * price + self.y_hold - (x * price + y)
+
+        snapshot = {
+            f"{self.name}_value_x": x + fees_x,
+            f"{self.name}_value_y": y + fees_y,
+            f"{self.name}_fees_x": fees_x,
+            f"{self.name}_fees_y": fees_y,
+            f"{self.name}_il_to_x": il_to_x,
+            f"{self.name}_il_to_y": il_to_y,
+            f"{self.name}_total_gas_costs": np.full(len(price), float(self.total_gas_costs)),
+        }
+        return snapshot
+
     def snapshot(
         self, timestamp: datetime, price: float, block_number: Optional[int]
     ) -> dict:
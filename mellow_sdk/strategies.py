@@ -1,12 +1,37 @@
 from abc import ABC, abstractmethod
-import numpy as np
+import datetime
+import logging
+import polars as pl
 import typing as tp
-import copy
 
 from mellow_sdk.uniswap_utils import UniswapLiquidityAligner
 from mellow_sdk.positions import UniV3Position, BiCurrencyPosition
 from mellow_sdk.primitives import Pool, MIN_TICK, MAX_TICK
 
+logger = logging.getLogger(__name__)
+
+_MIN_TICK_PRICE = 1.0001 ** MIN_TICK
+_MAX_TICK_PRICE = 1.0001 ** MAX_TICK
+
+_NS_IN_SECOND = 1_000_000_000
+_NS_IN_DAY = 86_400 * _NS_IN_SECOND
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def _timestamp_ns(record) -> int:
+    """
+    | Get timestamp of the record as int nanoseconds since epoch.
+    | ``Backtest`` passes it in ``timestamp_ns``, otherwise it is computed from ``timestamp``,
+    | naive datetimes are treated as UTC as in polars.
+    """
+    timestamp_ns = record.get("timestamp_ns")
+    if timestamp_ns is not None:
+        return timestamp_ns
+    timestamp = record["timestamp"]
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return (timestamp - _EPOCH) // datetime.timedelta(microseconds=1) * 1000
+
 
 class AbstractStrategy(ABC):
     """
@@ -36,6 +61,33 @@ class AbstractStrategy(ABC):
         """
         raise Exception(NotImplemented)
 
+    def relevant_events(self) -> tp.Optional[pl.Expr]:
+        """
+        | Filter of events the strategy acts on. ``Backtest`` calls ``rebalance`` only for rows matching it,
+        | portfolio stays the same in between and its snapshots are forward filled to the skipped rows.
+        | Skipped rows keep their own timestamp, price and block number, but position values of the last
+        | relevant row, i.e. they are valued at the price of that row. So the result is the same as without
+        | the filter only if price does not change on skipped rows, as in ``RawDataUniV3`` data where mints
+        | and burns carry the price of the last swap.
+        | None means every event is relevant.
+
+        Returns:
+            Polars expression to filter backtest data or None.
+        """
+        return None
+
+    @property
+    def required_columns(self) -> tp.Optional[tp.List[str]]:
+        """
+        | Columns of backtest data that ``rebalance`` reads from ``record``.
+        | ``Backtest`` converts only them (plus timestamp, price and block_number) for row by row access.
+        | None means every column is passed.
+
+        Returns:
+            List of column names or None.
+        """
+        return None
+
 
 class Hold(AbstractStrategy):
     """
@@ -44,14 +96,21 @@ class Hold(AbstractStrategy):
 
     def __init__(self, name: str = None):
         super().__init__(name)
-        self.prev_gain_date = None
+        self.prev_gain_day = None
+        self._vault = None
+
+    @property
+    def required_columns(self) -> tp.List[str]:
+        return ["timestamp", "timestamp_ns"]
 
     def rebalance(self, *args, **kwargs):
-        timestamp = kwargs["record"]["timestamp"]
+        record = kwargs["record"]
         portfolio = kwargs["portfolio"]
+        # days since epoch
+        day = _timestamp_ns(record) // _NS_IN_DAY
 
-        if self.prev_gain_date is None:
-            self.prev_gain_date = timestamp.date()
+        if self.prev_gain_day is None:
+            self.prev_gain_day = day
 
             bi_cur = BiCurrencyPosition(
                 name=f"Vault",
@@ -64,11 +123,11 @@ class Hold(AbstractStrategy):
             )
 
             portfolio.append(bi_cur)
+            self._vault = bi_cur
 
-        if timestamp.date() > self.prev_gain_date:
-            vault = portfolio.get_position("Vault")
-            vault.interest_gain(timestamp.date())
-            self.prev_gain_date = timestamp.date()
+        if day > self.prev_gain_day:
+            self._vault.interest_gain(record["timestamp"].date())
+            self.prev_gain_day = day
 
 
 class UniV3Passive(AbstractStrategy):
@@ -99,6 +158,13 @@ class UniV3Passive(AbstractStrategy):
         self.gas_cost = gas_cost
         self.swap_fee = pool.fee.fraction
 
+        self._uni_pos = None
+        self._bi_cur = None
+
+    @property
+    def required_columns(self) -> tp.List[str]:
+        return ["price_before", "price", "amount0", "amount1", "liquidity", "tick"]
+
     def rebalance(self, *args, **kwargs) -> str:
         record = kwargs["record"]
         portfolio = kwargs["portfolio"]
@@ -110,10 +176,11 @@ class UniV3Passive(AbstractStrategy):
             self.create_uni_position(portfolio=portfolio, price=price)
             is_rebalanced = "mint"
 
-        if "UniV3Passive" in portfolio.positions:
-            uni_pos: UniV3Position = portfolio.get_position("UniV3Passive")
+        if self._uni_pos is not None:
+            uni_pos: UniV3Position = self._uni_pos
             # uni_pos.charge_fees(price_before, price)
-            uni_pos.charge_fees_share(amount0=record['amount0'], amount1=record['amount1'], liquidity=record['liquidity'])
+            uni_pos.charge_fees_share(amount0=record['amount0'], amount1=record['amount1'], liquidity=record['liquidity'],
+                                      price_0=price_before, price_1=price, tick=record['tick'])
 
         return is_rebalanced
 
@@ -140,21 +207,10 @@ class UniV3Passive(AbstractStrategy):
 
         portfolio.append(bi_cur)
         portfolio.append(uni_pos)
+        self._bi_cur = bi_cur
+        self._uni_pos = uni_pos
 
-        dx, dy = uni_pos.aligner.get_amounts_for_swap_to_optimal(
-            x, y, swap_fee=bi_cur.swap_fee, price=price
-        )
-
-        if dx > 0:
-            bi_cur.swap_x_to_y(dx, price=price)
-        if dy > 0:
-            bi_cur.swap_y_to_x(dy, price=price)
-
-        x_uni, y_uni = uni_pos.aligner.get_amounts_after_optimal_swap(
-            x, y, swap_fee=bi_cur.swap_fee, price=price
-        )
-        bi_cur.withdraw(x_uni, y_uni)
-        uni_pos.deposit(x_uni, y_uni, price=price)
+        bi_cur.mint_optimal(uni_pos, x, y, price=price)
 
 
 class StrategyByAddress(AbstractStrategy):
@@ -182,11 +238,37 @@ class StrategyByAddress(AbstractStrategy):
         self.fee_percent = pool.fee.fraction
         self.gas_cost = gas_cost
 
+        # caches of the portfolio positions, they are reset when the strategy gets another portfolio
+        self._portfolio = None
+        self._vault = None
+        # UniV3 positions of the portfolio by (tick_lower, tick_upper), other Uni positions by name
+        self._uni_positions = {}
+
+    def relevant_events(self) -> tp.Optional[pl.Expr]:
+        """
+        | All swaps, they charge fees, and mints / burns of the followed address.
+        | Subclasses that override ``rebalance`` get every event, unless they override this method too.
+        """
+        if type(self).rebalance is not StrategyByAddress.rebalance:
+            return None
+        return (pl.col("event") == "swap") | (
+            (pl.col("owner") == self.address) & pl.col("event").is_in(["mint", "burn"])
+        )
+
+    @property
+    def required_columns(self) -> tp.List[str]:
+        return [
+            "event", "owner", "price_before", "price",
+            "amount0", "amount1", "liquidity", "tick_lower", "tick_upper",
+        ]
+
     def rebalance(self, *args, **kwargs):
         is_rebalanced = None
 
         record = kwargs["record"]
         portfolio = kwargs["portfolio"]
+        if portfolio is not self._portfolio:
+            self._bind_portfolio(portfolio)
         event = record["event"]
 
         if event == "mint":
@@ -232,31 +314,80 @@ class StrategyByAddress(AbstractStrategy):
 
         if event == "swap":
             price_before, price = record["price_before"], record["price"]
-            for name, pos in portfolio.positions.items():
-                if "Uni" in name:
-                    pos.charge_fees(price_before, price)
+            for pos in self._uni_positions.values():
+                pos.charge_fees(price_before, price)
 
         self.perform_clearing(portfolio)
         return is_rebalanced
 
+    def _bind_portfolio(self, portfolio):
+        """
+        | Reset cached positions when the strategy is backtested with another portfolio,
+        | e.g. the same instance is reused for several backtests or copied for CV folds.
+        | New objects are created, so copies of the strategy do not share them.
+        | Uni positions the portfolio already holds are cached as well.
+        """
+        self._portfolio = portfolio
+        self._vault = None
+        self._uni_positions = {}
+        for name, pos in portfolio.positions.items():
+            if "Uni" in name:
+                self._uni_positions[self._position_key(name)] = pos
+
+    @staticmethod
+    def _position_key(name: str):
+        """
+        Get ``(tick_lower, tick_upper)`` from ``UniV3_{tick_lower}_{tick_upper}`` name, other names are kept as is.
+        """
+        parts = name.split("_")
+        if len(parts) == 3 and parts[0] == "UniV3":
+            try:
+                return int(parts[1]), int(parts[2])
+            except ValueError:
+                pass
+        return name
+
+    def _get_vault(self, portfolio):
+        """
+        Get ``Vault`` position of the portfolio, the reference is cached after the first lookup.
+        """
+        if self._vault is None:
+            self._vault = portfolio.get_position("Vault")
+        return self._vault
+
+    def _get_uni_position(self, portfolio, tick_lower, tick_upper):
+        """
+        | Get UniV3 position of the portfolio by its ticks, or None if there is no such position.
+        | Positions appended to the portfolio by others are looked up by name and cached.
+        """
+        key = (tick_lower, tick_upper)
+        pos = self._uni_positions.get(key)
+        if pos is None:
+            pos = portfolio.positions.get(f"UniV3_{tick_lower}_{tick_upper}")
+            if pos is not None:
+                self._uni_positions[key] = pos
+        return pos
+
     def perform_swap(self, portfolio, amount_0, amount_1):
-        vault = portfolio.get_position("Vault")
+        vault = self._get_vault(portfolio)
+        # positive amount is paid to the pool, negative one is received from it
         if amount_0 > 0:
-            if vault.x < amount_0:
-                vault.deposit(amount_0 - vault.x + 1e-6, 0)
-            vault.withdraw(amount_0, 0)
-            vault.deposit(0, -amount_1)
+            pay_x, pay_y, get_x, get_y = amount_0, 0, 0, -amount_1
         else:
-            if vault.y < amount_1:
-                vault.deposit(0, amount_1 - vault.y + 1e-6)
-            vault.withdraw(0, amount_1)
-            vault.deposit(-amount_0, 0)
+            pay_x, pay_y, get_x, get_y = 0, amount_1, -amount_0, 0
+
+        if vault.x < pay_x:
+            vault.deposit(pay_x - vault.x + 1e-6, 0)
+        if vault.y < pay_y:
+            vault.deposit(0, pay_y - vault.y + 1e-6)
+        vault.withdraw(pay_x, pay_y)
+        vault.deposit(get_x, get_y)
 
     def perform_mint(
         self, portfolio, amount_0, amount_1, tick_lower, tick_upper, liquidity
     ):
-        name = f"UniV3_{tick_lower}_{tick_upper}"
-        vault = portfolio.get_position("Vault")
+        key = (tick_lower, tick_upper)
+        vault = self._get_vault(portfolio)
 
         if vault.x < amount_0:
             vault.deposit(amount_0 - vault.x + 1e-6, 0)
@@ -270,53 +401,55 @@ class StrategyByAddress(AbstractStrategy):
             tick_upper
         )
 
-        if name in portfolio.positions:
-            univ3_pos_old = portfolio.get_position(name)
+        univ3_pos_old = self._get_uni_position(portfolio, tick_lower, tick_upper)
+        if univ3_pos_old is not None:
             univ3_pos_old.liquidity = univ3_pos_old.liquidity + liquidity
             univ3_pos_old.x_hold += amount_0
             univ3_pos_old.y_hold += amount_1
             # univ3_pos_old.bi_currency.deposit(amount_0, amount_1)
         else:
             univ3_pos = UniV3Position(
-                name, price_lower, price_upper, self.fee_percent, self.gas_cost
+                f"UniV3_{tick_lower}_{tick_upper}", price_lower, price_upper, self.fee_percent, self.gas_cost
             )
             univ3_pos.liquidity = liquidity
             univ3_pos.x_hold += amount_0
             univ3_pos.y_hold += amount_1
             # univ3_pos.bi_currency.deposit(amount_0, amount_1)
             portfolio.append(univ3_pos)
+            self._uni_positions[key] = univ3_pos
 
     def perform_burn(
         self, portfolio, amount_0, amount_1, tick_lower, tick_upper, liquidity, price
     ):
-        name = f"UniV3_{tick_lower}_{tick_upper}"
-
-        if name in portfolio.positions:
-            univ3_pos_old = portfolio.get_position(name)
-            vault = portfolio.get_position("Vault")
+        univ3_pos_old = self._get_uni_position(portfolio, tick_lower, tick_upper)
+        if univ3_pos_old is not None:
+            vault = self._get_vault(portfolio)
             vault.deposit(amount_0, amount_1)
 
             if liquidity > 0:
                 if liquidity > univ3_pos_old.liquidity:
-                    print("Diff =", liquidity - univ3_pos_old.liquidity)
+                    if __debug__:
+                        logger.debug("Diff = %s", liquidity - univ3_pos_old.liquidity)
                     x_out, y_out = univ3_pos_old.burn(univ3_pos_old.liquidity, price)
                 else:
                     x_out, y_out = univ3_pos_old.burn(liquidity, price)
             else:
-                print(f"Negative liq {liquidity}")
+                if __debug__:
+                    logger.debug("Negative liq %s", liquidity)
         else:
-            print(f"There is no position to burn {name}")
+            if __debug__:
+                logger.debug("There is no position to burn UniV3_%s_%s", tick_lower, tick_upper)
 
     def perform_clearing(self, portfolio):
-        poses = copy.copy(portfolio.positions)
-        for name, pos in poses.items():
-            if "UniV3" in name:
-                univ3 = portfolio.get_position(name)
-                if univ3.liquidity < 1e1:
-                    portfolio.remove(name)
+        to_remove = [
+            key for key, pos in self._uni_positions.items()
+            if pos.liquidity < 1e1 and "UniV3" in pos.name
+        ]
+        for key in to_remove:
+            portfolio.remove(self._uni_positions.pop(key).name)
 
     def _tick_to_price(self, tick):
-        price = np.power(1.0001, tick)
+        price = 1.0001 ** tick
         return price
 
 
@@ -347,12 +480,26 @@ class StrategyCatchThePrice(AbstractStrategy):
         self.seconds_to_hold = seconds_to_hold
 
         self.last_mint_price = None
-        self.last_timestamp_in_interval = None
+        self._tracking_lower = None
+        self._tracking_upper = None
+        self.last_timestamp_in_interval_ns = None
         self.pos_num = None
         self.w = 0
         self.create_pos_time = None
 
-    def create_pos(self, x_in, y_in, price, timestamp, portfolio):
+        self._uni_pos = None
+        self._bi_cur = None
+
+    def relevant_events(self) -> tp.Optional[pl.Expr]:
+        """
+        | Strategy processes only swap events.
+        | Subclasses that override ``rebalance`` get every event, unless they override this method too.
+        """
+        if type(self).rebalance is not StrategyCatchThePrice.rebalance:
+            return None
+        return pl.col("event") == "swap"
+
+    def create_pos(self, x_in, y_in, price, timestamp, timestamp_ns, portfolio):
         """
             Swaps x_in, y_in in right proportion and mint to new interval
         """
@@ -362,7 +509,7 @@ class StrategyCatchThePrice(AbstractStrategy):
             self.pos_num += 1
 
         # bicurrency position that can swap tokens
-        bi_cur: BiCurrencyPosition = portfolio.get_position('main_vault')
+        bi_cur: BiCurrencyPosition = self._bi_cur
 
         # add tokens to bicurrency position
         bi_cur.deposit(x_in, y_in)
@@ -370,47 +517,38 @@ class StrategyCatchThePrice(AbstractStrategy):
         # new uni position
         uni_pos = UniV3Position(
             name=f'UniV3_{self.pos_num}',
-            lower_price=max(1.0001 ** MIN_TICK, price - self.width),
-            upper_price=min(1.0001 ** MAX_TICK, price + self.width),
+            lower_price=max(_MIN_TICK_PRICE, price - self.width),
+            upper_price=min(_MAX_TICK_PRICE, price + self.width),
             fee_percent=self.fee_percent,
             gas_cost=self.gas_cost,
         )
 
         # add new position to portfolio
         portfolio.append(uni_pos)
+        self._uni_pos = uni_pos
 
-        # uni_pos.aligner is UniswapLiquidityAligner, good class for working with liquidity operations
-        dx, dy = uni_pos.aligner.get_amounts_for_swap_to_optimal(
-            x_in, y_in, swap_fee=bi_cur.swap_fee, price=price
-        )
-
-        # swap tokens to right proportion (if price in interval swaps to equal liquidity in each token)
-        if dx > 0:
-            bi_cur.swap_x_to_y(dx, price=price)
-        if dy > 0:
-            bi_cur.swap_y_to_x(dy, price=price)
-
-        x_uni, y_uni = uni_pos.aligner.get_amounts_after_optimal_swap(
-            x_in, y_in, swap_fee=bi_cur.swap_fee, price=price
-        )
-        assert (x_uni, y_uni == bi_cur.to_xy(price))
-        uni_pos.aligner.check_xy_is_optimal(price, x_uni, y_uni)
-
-        # withdraw tokens from bicurrency
-        # because of float numbers precision subtract 1e-9
-        bi_cur.withdraw(x_uni, y_uni)
-
-        # deposit tokens to uni
-        uni_pos.deposit(x_uni, y_uni, price=price)
+        # swap tokens to right proportion (if price in interval swaps to equal liquidity in each token),
+        # withdraw them from bicurrency and deposit to uni
+        bi_cur.mint_optimal(uni_pos, x_in, y_in, price=price)
 
         # remember last mint price to track price in interval
         self.last_mint_price = price
+        self._tracking_lower = price - self.width
+        self._tracking_upper = price + self.width
 
         # remember timestamp price was in interval
-        self.last_timestamp_in_interval = timestamp
+        self.last_timestamp_in_interval_ns = timestamp_ns
         self.create_pos_time = timestamp
 
-        print("created", uni_pos.fees_x)
+        if __debug__:
+            logger.debug("created %s", uni_pos.fees_x)
+
+    @property
+    def required_columns(self) -> tp.List[str]:
+        return [
+            "timestamp", "timestamp_ns", "event", "price_before", "price",
+            "amount0", "amount1", "liquidity", "tick",
+        ]
 
     def rebalance(self, *args, **kwargs) -> str:
         """
@@ -421,7 +559,7 @@ class StrategyCatchThePrice(AbstractStrategy):
         """
         # record is row of historic data
         record = kwargs['record']
-        timestamp = record['timestamp']
+        timestamp, timestamp_ns = record['timestamp'], _timestamp_ns(record)
         event = record['event']
 
         # portfolio managed by the strategy
@@ -444,33 +582,39 @@ class StrategyCatchThePrice(AbstractStrategy):
                 y_interest=None
             )
             portfolio.append(bi_cur)
+            self._bi_cur = bi_cur
 
             # create first uni interval
-            self.create_pos(x_in=1/price, y_in=1, price=price, timestamp=timestamp, portfolio=portfolio)
+            self.create_pos(
+                x_in=1/price, y_in=1, price=price, timestamp=timestamp, timestamp_ns=timestamp_ns, portfolio=portfolio
+            )
             return 'init'
 
         # collect fees from uni
-        uni_pos = portfolio.get_position(f'UniV3_{self.pos_num}')
+        uni_pos: UniV3Position = self._uni_pos
         # uni_pos.charge_fees(price_0=price_before, price_1=price)
         uni_pos.charge_fees_share(amount0=record['amount0'], amount1=record['amount1'],
                                   liquidity=record['liquidity'], price_0=price_before, price_1=price, tick=record["tick"])
 
-        # if price in interval update last_timestamp_in_interval
-        if abs(self.last_mint_price - price) < self.width:
-            self.last_timestamp_in_interval = timestamp
+        # if price in interval update last_timestamp_in_interval_ns
+        if self._tracking_lower < price < self._tracking_upper:
+            self.last_timestamp_in_interval_ns = timestamp_ns
             return None
 
         # if price outside interval for long create new uni position
-        if (timestamp - self.last_timestamp_in_interval).total_seconds() > self.seconds_to_hold:
+        if timestamp_ns - self.last_timestamp_in_interval_ns > self.seconds_to_hold * _NS_IN_SECOND:
             if (self.w < 5):
                 self.w += 1
-                uni_pos: UniV3Position = portfolio.get_position(f'UniV3_{self.pos_num}')
                 x_out, y_out = uni_pos.withdraw(price)
-                print("Time:", (timestamp - self.create_pos_time))
+                if __debug__:
+                    logger.debug("Time: %s", timestamp - self.create_pos_time)
 
-                portfolio.remove(f'UniV3_{self.pos_num}')
+                portfolio.remove(uni_pos.name)
+                self._uni_pos = None
 
-                self.create_pos(x_in=x_out, y_in=y_out, price=price, timestamp=timestamp, portfolio=portfolio)
+                self.create_pos(
+                    x_in=x_out, y_in=y_out, price=price, timestamp=timestamp, timestamp_ns=timestamp_ns, portfolio=portfolio
+                )
                 return 'rebalance'
 
         return None
@@ -265,11 +265,28 @@ class UniswapLiquidityAligner:
                 x_after_swap: Amount of X tokens after optimal swap.
                 y_after_swap: Amount of Y tokens after optimal swap.
         """
-        dx, dy = self.get_amounts_for_swap_to_optimal(x, y, price, swap_fee)
+        _, _, x, y = self.get_swap_and_amounts_to_optimal(x, y, price, swap_fee)
+        return x, y
 
-        x -= dx
-        y -= dy
+    def get_swap_and_amounts_to_optimal(
+        self, x: float, y: float, price: float, swap_fee: float
+    ) -> Tuple[float, float, float, float]:
+        """
+        Calculate the amounts to swap and the amounts of X and Y tokens after optimal swap in one call.
+        Args:
+            x: Amount of X tokens.
+            y: Amount of Y tokens.
+            price: Current market price.
+            swap_fee: Swap fee.
+        Returns:
+            (x_swap, y_swap, x_after_swap, y_after_swap):
+                x_swap: Amount of X tokens that must be swapped to provide optimal liquidity at a given price.
+                y_swap: Amount of Y tokens that must be swapped to provide optimal liquidity at a given price.
+                x_after_swap: Amount of X tokens after optimal swap.
+                y_after_swap: Amount of Y tokens after optimal swap.
+        """
+        dx, dy = self.get_amounts_for_swap_to_optimal(x, y, price, swap_fee)
 
-        x += dy * (1 - swap_fee) / price
-        y += dx * (1 - swap_fee) * price
-        return x, y
+        x_after_swap = x - dx + dy * (1 - swap_fee) / price
+        y_after_swap = y - dy + dx * (1 - swap_fee) * price
+        return dx, dy, x_after_swap, y_after_swap
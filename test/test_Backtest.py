@@ -0,0 +1,279 @@
+"""
+    Test Backtest
+    functions:
+        backtest - YES
+        RecordView - YES
+        strategy reuse - YES
+        continue on a portfolio with positions - YES
+        mint to a position of the portfolio - YES
+        run_sweep - YES
+        relevant_events - YES
+        vectorized uni history - YES
+        direct rebalance calls - YES
+        subclass rebalance gets every event - YES
+
+    python -m unittest test/test_Backtest.py
+
+"""
+
+
+import unittest
+from datetime import datetime, timedelta
+import numpy as np
+import polars as pl
+
+from mellow_sdk.backtest import Backtest, RecordView
+from mellow_sdk.portfolio import Portfolio
+from mellow_sdk.positions import BiCurrencyPosition, UniV3Position
+from mellow_sdk.primitives import Pool, POOLS
+from mellow_sdk.strategies import Hold, StrategyByAddress, StrategyCatchThePrice, UniV3Passive
+
+
+POOL = Pool(tokenA=POOLS[1]['token0'], tokenB=POOLS[1]['token1'], fee=POOLS[1]['fee'])
+
+
+def make_df(n: int = 400, seed: int = 0) -> pl.DataFrame:
+    """
+        Synthetic pool events, mints and burns carry the price of the last swap as in RawDataUniV3
+    """
+    rng = np.random.default_rng(seed)
+    events = rng.choice(['swap', 'mint', 'burn'], n, p=[0.8, 0.1, 0.1])
+    events[0] = 'swap'
+    owners = rng.choice(['0xabc', '0xdef'], n, p=[0.3, 0.7])
+
+    price = np.exp(np.cumsum(rng.normal(0, 0.0004, n)))
+    last_swap = np.maximum.accumulate(np.where(events == 'swap', np.arange(n), 0))
+    price = 2 * price[last_swap]
+    tick = np.floor(np.log(price) / np.log(1.0001)).astype(np.int64)
+    tick_lower = (tick - 100) // 200 * 200
+
+    amount0 = rng.normal(0, 1, n)
+    amount1 = -amount0 * price
+    is_swap = events == 'swap'
+
+    return pl.DataFrame([
+        pl.Series('timestamp', [datetime(2022, 1, 1) + timedelta(minutes=7 * i) for i in range(n)]),
+        pl.Series('block_number', np.arange(n) // 2),
+        pl.Series('price', price),
+        pl.Series('price_before', np.r_[price[0], price[:-1]]),
+        pl.Series('amount0', np.where(is_swap, amount0, np.abs(amount0))),
+        pl.Series('amount1', np.where(is_swap, amount1, np.abs(amount1))),
+        pl.Series('liquidity', rng.uniform(1e3, 1e4, n)),
+        pl.Series('tick', tick),
+        pl.Series('tick_lower', tick_lower),
+        pl.Series('tick_upper', tick_lower + 400),
+        pl.Series('event', [str(event) for event in events]),
+        pl.Series('owner', [str(owner) for owner in owners]),
+    ])
+
+
+class CountingHold(Hold):
+    """
+        Hold that counts rebalance calls
+    """
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def rebalance(self, *args, **kwargs):
+        self.calls += 1
+        return super().rebalance(*args, **kwargs)
+
+
+class LoopUniV3Passive(UniV3Passive):
+    """
+        UniV3Passive that is backtested by the generic row loop
+    """
+
+
+class AllEventsByAddress(StrategyByAddress):
+    """
+        StrategyByAddress that gets every event
+    """
+    def relevant_events(self):
+        return None
+
+
+class AllEventsCatchThePrice(StrategyCatchThePrice):
+    """
+        StrategyCatchThePrice that gets every event
+    """
+    def relevant_events(self):
+        return None
+
+
+class CountingCatchThePrice(StrategyCatchThePrice):
+    """
+        StrategyCatchThePrice that counts rebalance calls
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = 0
+
+    def rebalance(self, *args, **kwargs):
+        self.calls += 1
+        return super().rebalance(*args, **kwargs)
+
+
+def make_vault_portfolio() -> Portfolio:
+    return Portfolio('main', [BiCurrencyPosition('Vault', swap_fee=0, gas_cost=0, x=0, y=0)])
+
+
+class TestBacktest(unittest.TestCase):
+    """
+        test Backtest
+    """
+    def setUp(self):
+        self.df = make_df()
+
+    def test_record_view(self):
+        columns = Backtest._to_columns(self.df)
+        expected = {**self.df[3].to_dicts()[0], 'timestamp_ns': columns['timestamp_ns'][3]}
+        record = RecordView(columns, 3)
+
+        self.assertEqual(len(record), len(expected))
+        self.assertEqual(list(record), list(expected))
+        self.assertEqual(dict(record.items()), expected)
+        self.assertEqual(list(record.values()), list(expected.values()))
+        self.assertEqual(record.copy(), expected)
+        self.assertEqual(record, expected)
+        self.assertIsNone(record.get('missing'))
+
+    def test_subclass_rebalance_is_called(self):
+        strategy = CountingHold()
+        portfolio_history, _, _ = Backtest(strategy).backtest(self.df)
+
+        self.assertEqual(strategy.calls, self.df.shape[0])
+        self.assertEqual(portfolio_history.to_df().shape[0], self.df.shape[0])
+
+    def test_subclass_gets_every_event(self):
+        strategy = CountingCatchThePrice(name='catch', pool=POOL, gas_cost=0, width=0.002, seconds_to_hold=60 * 60)
+        Backtest(strategy).backtest(self.df)
+
+        self.assertIsNone(strategy.relevant_events())
+        self.assertEqual(strategy.calls, self.df.shape[0])
+
+    def test_strategy_reuse(self):
+        strategy = StrategyByAddress(address='0xabc', pool=POOL, gas_cost=0)
+
+        results = []
+        for _ in range(2):
+            portfolio_history, _, uni_history = Backtest(strategy, make_vault_portfolio()).backtest(self.df)
+            results.append((portfolio_history.to_df(), uni_history.to_df()))
+
+        (portfolio_df_1, uni_df_1), (portfolio_df_2, uni_df_2) = results
+        self.assertGreater(uni_df_1.shape[0], 0)
+        self.assertTrue(portfolio_df_1.frame_equal(portfolio_df_2, null_equal=True))
+        self.assertTrue(uni_df_1.frame_equal(uni_df_2))
+
+    def test_continue_backtest(self):
+        make_strategy = lambda: StrategyByAddress(address='0xabc', pool=POOL, gas_cost=0)
+        n = self.df.shape[0] // 2
+
+        full, _, _ = Backtest(make_strategy(), make_vault_portfolio()).backtest(self.df)
+
+        portfolio = make_vault_portfolio()
+        Backtest(make_strategy(), portfolio).backtest(self.df[:n])
+        self.assertGreater(len(portfolio.positions), 1)
+        continued, _, _ = Backtest(make_strategy(), portfolio).backtest(self.df[n:])
+
+        continued_df, full_df = continued.to_df(), full.to_df()[n:]
+        # columns of positions closed in the first half are empty in the second one
+        for name in set(full_df.columns) - set(continued_df.columns):
+            self.assertEqual(full_df[name].null_count(), full_df.shape[0])
+        self.assertTrue(continued_df.frame_equal(full_df.select(continued_df.columns), null_equal=True))
+
+    def test_mint_to_existing_position(self):
+        record = {
+            'event': 'mint', 'owner': '0xabc', 'price_before': 2., 'price': 2.,
+            'amount0': 1., 'amount1': 2., 'liquidity': 1e3, 'tick_lower': 6800, 'tick_upper': 7200,
+        }
+
+        # position held before the strategy gets the portfolio, and appended after it
+        for append_later in (False, True):
+            strategy = StrategyByAddress(address='0xabc', pool=POOL, gas_cost=0)
+            portfolio = make_vault_portfolio()
+            uni_pos = UniV3Position('UniV3_6800_7200', 1.0001 ** 6800, 1.0001 ** 7200, 0.003, 0)
+            uni_pos.liquidity, uni_pos.x_hold, uni_pos.y_hold, uni_pos.fees_x = 5e3, 3., 4., 0.5
+
+            if append_later:
+                strategy.rebalance(record={**record, 'event': 'swap', 'owner': '0xdef'}, portfolio=portfolio)
+            portfolio.append(uni_pos)
+            strategy.rebalance(record=record, portfolio=portfolio)
+
+            self.assertIs(portfolio.get_position('UniV3_6800_7200'), uni_pos)
+            self.assertEqual((uni_pos.liquidity, uni_pos.x_hold, uni_pos.y_hold), (6e3, 4., 6.))
+            self.assertEqual(uni_pos.fees_x, 0.5)
+
+    def test_run_sweep(self):
+        widths = [0.001, 0.002, 0.004]
+        make_strategy = lambda width: StrategyCatchThePrice(
+            name='catch', pool=POOL, gas_cost=0, width=width, seconds_to_hold=60 * 60
+        )
+
+        parallel = Backtest.run_sweep([make_strategy(width) for width in widths], self.df, n_jobs=2)
+        serial = [Backtest(make_strategy(width)).backtest(self.df) for width in widths]
+
+        self.assertEqual(len(parallel), len(widths))
+        for parallel_histories, serial_histories in zip(parallel, serial):
+            for parallel_history, serial_history in zip(parallel_histories, serial_histories):
+                self.assertTrue(
+                    parallel_history.to_df().frame_equal(serial_history.to_df(), null_equal=True)
+                )
+
+    def test_relevant_events(self):
+        cases = [
+            (
+                lambda cls: cls(address='0xabc', pool=POOL, gas_cost=0),
+                (StrategyByAddress, AllEventsByAddress),
+                make_vault_portfolio,
+            ),
+            (
+                lambda cls: cls(name='catch', pool=POOL, gas_cost=0, width=0.002, seconds_to_hold=60 * 60),
+                (StrategyCatchThePrice, AllEventsCatchThePrice),
+                lambda: None,
+            ),
+        ]
+
+        for make_strategy, (cls, all_events_cls), make_portfolio in cases:
+            filtered = Backtest(make_strategy(cls), make_portfolio()).backtest(self.df)
+            full = Backtest(make_strategy(all_events_cls), make_portfolio()).backtest(self.df)
+
+            portfolio_df = filtered[0].to_df()
+            self.assertEqual(portfolio_df.shape[0], self.df.shape[0])
+            self.assertTrue(portfolio_df.frame_equal(full[0].to_df(), null_equal=True))
+            self.assertTrue(filtered[1].to_df().frame_equal(full[1].to_df(), null_equal=True))
+            self.assertTrue(filtered[2].to_df().frame_equal(full[2].to_df()))
+
+    def test_vectorized_uni_history(self):
+        histories = [
+            Backtest(cls(lower_price=1.9, upper_price=2.1, pool=POOL, gas_cost=0)).backtest(self.df)[2]
+            for cls in (UniV3Passive, LoopUniV3Passive)
+        ]
+        vectorized, loop = histories
+
+        self.assertEqual(len(vectorized.positions), 1)
+        self.assertEqual(len(loop.positions), 1)
+        self.assertEqual(vectorized.to_df().shape[0], self.df.shape[0])
+        self.assertTrue(vectorized.to_df().frame_equal(loop.to_df()))
+
+    def test_direct_rebalance(self):
+        make_strategies = [
+            Hold,
+            lambda: StrategyCatchThePrice(name='catch', pool=POOL, gas_cost=0, width=0.002, seconds_to_hold=60 * 60),
+        ]
+
+        for make_strategy in make_strategies:
+            portfolio_history, _, _ = Backtest(make_strategy()).backtest(self.df)
+
+            strategy, portfolio = make_strategy(), Portfolio('main')
+            snapshots = []
+            for record in self.df.to_dicts():
+                strategy.rebalance(record=record, portfolio=portfolio)
+                snapshots.append(portfolio.snapshot(record['timestamp'], record['price'], record['block_number']))
+
+            self.assertEqual(portfolio_history.snapshots, snapshots)
+
+
+if __name__ == "__main__":
+    unittest.main()
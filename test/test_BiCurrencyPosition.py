@@ -3,6 +3,7 @@
     functions:
         rebalance - YES
         interest_gain - YES
+        mint_optimal - YES
 
         python -m unittest test/test_BiCurrencyPosition.py
 """
@@ -12,7 +13,7 @@ import numpy as np
 import unittest
 
 from datetime import datetime
-from mellow_sdk.positions import BiCurrencyPosition
+from mellow_sdk.positions import BiCurrencyPosition, UniV3Position
 
 
 class TestBiCurrencyPosition(unittest.TestCase):
@@ -107,6 +108,35 @@ class TestBiCurrencyPosition(unittest.TestCase):
             np.allclose([pos.x, pos.y], [348.9119856672034, 370836.27527132386], atol=1e-08, rtol=0)
         )
 
+    def test_mint_optimal(self):
+        pos = BiCurrencyPosition(
+            name='',
+            swap_fee=0.003,
+            gas_cost=0.01,
+            x=1,
+            y=1,
+        )
+        uni_pos = UniV3Position(
+            name='',
+            lower_price=0.5,
+            upper_price=2,
+            fee_percent=0.003,
+            gas_cost=0.01,
+        )
+
+        x_uni, y_uni = pos.mint_optimal(uni_pos, x=1, y=0.5, price=1)
+
+        # interval is symmetric around price, so optimal amounts are equal
+        dx = 0.5 / (2 - 0.003)
+        self.assertTrue(
+            np.allclose(
+                [x_uni, y_uni, pos.x, pos.y, uni_pos.x_hold, uni_pos.y_hold, pos.total_gas_costs],
+                [1 - dx, 1 - dx, 0, 0.5, 1 - dx, 1 - dx, 0.01],
+                atol=1e-08,
+                rtol=0,
+            )
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,116 @@
+"""
+    Test PortfolioHistory
+    functions:
+        add_snapshot - YES
+        preallocate - YES
+        add_snapshots - YES
+        set_timeline - YES
+        snapshots - YES
+        to_df - YES
+
+    python -m unittest test/test_PortfolioHistory.py
+
+"""
+
+
+import unittest
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import polars as pl
+
+from mellow_sdk.history import PortfolioHistory
+
+
+def make_snapshots() -> list:
+    """
+        Snapshots of a portfolio where a position is opened, another one is closed and opened again
+    """
+    snapshots = []
+    for i in range(10):
+        snapshot = {
+            'timestamp': datetime(2022, 1, 1) + timedelta(hours=i),
+            'price': 1. + i / 10,
+            'block_number': 100 + i,
+            'Vault_value_x': 1. - i / 100,
+            'Vault_value_y': 2. + i / 100,
+        }
+        if i >= 3:
+            snapshot['UniV3_1_value_x'] = 0.5 * i
+            snapshot['UniV3_1_value_y'] = 0.25 * i
+        if i < 2 or i >= 7:
+            snapshot['UniV3_2_value_y'] = 3. * i
+        snapshots.append(snapshot)
+    return snapshots
+
+
+class TestPortfolioHistory(unittest.TestCase):
+    """
+        test PortfolioHistory
+    """
+    def setUp(self):
+        self.snapshots = make_snapshots()
+
+    def check_history(self, history: PortfolioHistory):
+        expected = pl.from_pandas(pd.DataFrame(self.snapshots))
+        df = history.to_df()
+
+        self.assertEqual(df.columns, expected.columns)
+        self.assertTrue(df.frame_equal(expected, null_equal=True))
+        self.assertEqual(history.snapshots, self.snapshots)
+
+    def test_layout_change(self):
+        history = PortfolioHistory()
+        history.preallocate(len(self.snapshots), ['price'])
+        for snapshot in self.snapshots:
+            history.add_snapshot(snapshot)
+
+        self.check_history(history)
+        df = history.to_df()
+        self.assertEqual(df['UniV3_1_value_x'].null_count(), 3)
+        self.assertEqual(df['UniV3_2_value_y'].null_count(), 5)
+
+    def test_grow(self):
+        history = PortfolioHistory()
+        history.preallocate(2, ['price'])
+        for snapshot in self.snapshots:
+            history.add_snapshot(snapshot)
+
+        self.assertEqual(history.snapshots_num, len(self.snapshots))
+        self.check_history(history)
+
+    def test_without_preallocate(self):
+        history = PortfolioHistory()
+        for snapshot in self.snapshots:
+            history.add_snapshot(snapshot)
+
+        self.check_history(history)
+
+    def test_add_snapshots(self):
+        history = PortfolioHistory()
+        history.add_snapshots(pl.from_pandas(pd.DataFrame(self.snapshots[:4])))
+        history.add_snapshots(pl.from_pandas(pd.DataFrame(self.snapshots[4:])))
+
+        snapshots = history.snapshots
+        self.assertEqual(len(snapshots), history.to_df().shape[0])
+        for snapshot, expected in zip(snapshots, self.snapshots):
+            self.assertEqual({key: snapshot[key] for key in expected}, expected)
+
+    def test_set_timeline(self):
+        rows = [0, 4, 7]
+        history = PortfolioHistory()
+        for i in rows:
+            history.add_snapshot(self.snapshots[i])
+        timeline = pl.from_pandas(pd.DataFrame(self.snapshots)[['timestamp', 'price', 'block_number']])
+        history.set_timeline(timeline, np.array(rows))
+
+        snapshots = history.snapshots
+        self.assertEqual(len(snapshots), len(self.snapshots))
+        self.assertEqual(len(snapshots), history.to_df().shape[0])
+        for i, snapshot in enumerate(snapshots):
+            last = self.snapshots[max(row for row in rows if row <= i)]
+            self.assertEqual(snapshot, {**last, **{key: self.snapshots[i][key] for key in timeline.columns}})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+"""
+    Test UniPositionsHistory
+    functions:
+        add_snapshot - YES
+        set_timeline - YES
+        to_df - YES
+
+    python -m unittest test/test_UniPositionsHistory.py
+
+"""
+
+
+import unittest
+from datetime import datetime, timedelta
+import numpy as np
+import polars as pl
+
+from mellow_sdk.history import UniPositionsHistory
+from mellow_sdk.positions import UniV3Position, BiCurrencyPosition
+
+
+def make_position(name: str, lower_price: float, upper_price: float, liquidity: float) -> UniV3Position:
+    pos = UniV3Position(name=name, lower_price=lower_price, upper_price=upper_price, fee_percent=0.003, gas_cost=0)
+    pos.liquidity = liquidity
+    return pos
+
+
+class TestUniPositionsHistory(unittest.TestCase):
+    """
+        test UniPositionsHistory
+    """
+    def setUp(self):
+        self.timestamps = pl.Series('timestamp', [datetime(2022, 1, 1) + timedelta(hours=i) for i in range(6)])
+        self.vault = BiCurrencyPosition('Vault', swap_fee=0, gas_cost=0, x=1, y=1)
+        self.first = make_position('UniV3_1', 1, 2, 10)
+        self.second = make_position('UniV3_2', 2, 3, 20)
+
+    def test_sparse_snapshots(self):
+        history = UniPositionsHistory()
+        # rows 0-1: no uni positions, rows 2-3: first, rows 4-5: first and second
+        history.add_snapshot(self.timestamps[0], {'Vault': self.vault})
+        history.add_snapshot(self.timestamps[2], {'Vault': self.vault, 'UniV3_1': self.first})
+        history.add_snapshot(
+            self.timestamps[4], {'Vault': self.vault, 'UniV3_1': self.first, 'UniV3_2': self.second}
+        )
+        history.set_timeline(self.timestamps, np.array([0, 2, 4]))
+
+        df = history.to_df()
+
+        self.assertEqual(df.columns, ['name', 'timestamp', 'lower_bound', 'upper_bound', 'liq'])
+        self.assertEqual(df['name'].to_list(), ['UniV3_1', 'UniV3_1', 'UniV3_1', 'UniV3_2', 'UniV3_1', 'UniV3_2'])
+        self.assertEqual(df['timestamp'].to_list(), [self.timestamps[i] for i in [2, 3, 4, 4, 5, 5]])
+        self.assertEqual(df['liq'].to_list(), [10, 10, 10, 20, 10, 20])
+        self.assertEqual(df['upper_bound'].to_list(), [2, 2, 2, 3, 2, 3])
+
+    def test_snapshots_on_same_row(self):
+        history = UniPositionsHistory()
+        # initial snapshot and snapshot after rebalance on the first row, the last one is used
+        history.add_snapshot(self.timestamps[0], {})
+        history.add_snapshot(self.timestamps[0], {'UniV3_1': self.first})
+        history.set_timeline(self.timestamps, np.array([0, 0]))
+
+        df = history.to_df()
+
+        self.assertEqual(df['name'].to_list(), ['UniV3_1'] * 6)
+        self.assertEqual(df['timestamp'].to_list(), self.timestamps.to_list())
+
+
+if __name__ == "__main__":
+    unittest.main()
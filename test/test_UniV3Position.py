@@ -5,6 +5,8 @@
         burn - YES
         charge_fees - YES
         swap_to_optimal - YES
+        snapshot_columns - YES
+        accumulate_fees - YES
 
     python -m unittest test/test_UniV3Position.py
 
@@ -16,6 +18,7 @@ from parameterized import parameterized
 import numpy as np
 
 from mellow_sdk.positions import UniV3Position
+from mellow_sdk._kernels import accumulate_fees
 
 
 class TestUniswapLiquidityAligner(unittest.TestCase):
@@ -218,6 +221,48 @@ class TestUniswapLiquidityAligner(unittest.TestCase):
         self.assertAlmostEqual(self.pos._fees_x_earned_, expected[0])
         self.assertAlmostEqual(self.pos._fees_y_earned_, expected[1])
 
+    def test_snapshot_columns(self):
+        self.pos.mint(x=100, y=0, price=10)
+        prices = np.array([9, 10, 15, 30, 31], dtype=float)
+        fees_x = np.array([0, 1, 2, 3, 4], dtype=float)
+        fees_y = np.array([0, 10, 20, 30, 40], dtype=float)
+
+        columns = self.pos.snapshot_columns(prices, fees_x, fees_y)
+
+        for i, price in enumerate(prices):
+            self.pos.fees_x, self.pos.fees_y = fees_x[i], fees_y[i]
+            snapshot = self.pos.snapshot(timestamp=None, price=price, block_number=None)
+            for key, value in snapshot.items():
+                self.assertAlmostEqual(columns[key][i], value, 8)
+
+    def test_accumulate_fees(self):
+        self.pos = UniV3Position(
+            name='TestPos',
+            lower_price=10,
+            upper_price=30,
+            fee_percent=0.5,
+            gas_cost=1,
+        )
+        self.pos.mint(x=100, y=0, price=10)
+
+        amount0 = np.array([-1, 2, -3, -4, 5, -6], dtype=float)
+        amount1 = np.array([10, -20, 30, 40, -50, 60], dtype=float)
+        liquidity = np.array([100, 200, 300, 400, 500, 600], dtype=float)
+        price_before = np.array([9, 10, 15, np.nan, 30, 31], dtype=float)
+
+        fees_x, fees_y = accumulate_fees(
+            amount0, amount1, liquidity, price_before,
+            self.pos.lower_price, self.pos.upper_price, self.pos.fee_percent, self.pos.liquidity
+        )
+
+        for i in range(len(amount0)):
+            if not np.isnan(price_before[i]):
+                self.pos.charge_fees_share(
+                    amount0[i], amount1[i], liquidity[i], price_before[i], price_before[i], tick=None
+                )
+            self.assertAlmostEqual(fees_x[i], self.pos.fees_x, 8)
+            self.assertAlmostEqual(fees_y[i], self.pos.fees_y, 8)
+
 
 if __name__ == "__main__":
     unittest.main()